@@ -4,13 +4,35 @@
 
 import cv2
 import os
-import torchvision.transforms as T
-from ultralytics import YOLO
+from functools import lru_cache
 import numpy as np
 import uuid
 import pytesseract
 import re
 
+# When set, cropped field images are saved to processed_images for inspection.
+_DEBUG_SAVE_CROPS = os.getenv("OCR_DEBUG_SAVE_CROPS", "0") == "1"
+
+# --- MODEL CACHE ---
+@lru_cache(maxsize=None)
+def _get_field_model(doc_type):
+    """
+    Loads and caches the field detection model for a document type.
+    Deserializing the .pt file on every request is expensive, so each model is
+    loaded once per process and the same instance is reused afterwards.
+    Prefers the INT8 OpenVINO export from quantize_models.py when present.
+    ultralytics (and torch with it) is imported here rather than at module
+    import so processes that never detect fields do not pay the cost.
+    """
+    from ultralytics import YOLO
+    int8_model_path = f"models/{doc_type}_model_openvino_int8_model"
+    if os.path.isdir(int8_model_path):
+        return YOLO(int8_model_path)
+    field_model_path = f"models/{doc_type}_model.pt"
+    if not os.path.exists(field_model_path):
+        raise FileNotFoundError(f"Field detection model not found at '{field_model_path}'.")
+    return YOLO(field_model_path)
+
 # --- HELPER FUNCTIONS ---
 def expand_box(x1, y1, x2, y2, img_shape, margin_ratio=0.05):
     """
@@ -28,23 +50,18 @@ def expand_box(x1, y1, x2, y2, img_shape, margin_ratio=0.05):
 
     return new_x1, new_y1, new_x2, new_y2
 
-def _get_preprocessed_image_data(image_data):
-    gray = cv2.cvtColor(image_data, cv2.COLOR_BGR2GRAY)
-    return gray
-
-# --- PERFORMS OCR ON THE IMAGE AND RETURNS THE AVERAGE CONFIDENCE SCORE ---
-def get_ocr_confidence(image):
-    custom_config = r'--oem 3 --psm 6'
+# --- DETECTS PAGE ROTATION WITH A SINGLE TESSERACT OSD CALL ---
+def detect_rotation(img):
+    """
+    Returns the clockwise rotation (0/90/180/270) needed to upright the text,
+    using Tesseract's orientation-and-script-detection classifier. This is one
+    lightweight call instead of full OCR passes on candidate rotations.
+    """
     try:
-        data = pytesseract.image_to_data(image, config=custom_config, output_type=pytesseract.Output.DICT)
-        confs = [int(conf) for conf in data["conf"] if conf != '-1']
-        avg_conf = sum(confs) / len(confs) if confs else 0
-        return avg_conf
-    except pytesseract.TesseractNotFoundError:
-        print("Tesseract is not installed or not in your PATH. OCR functionality will not work.")
-        return 0
+        osd = pytesseract.image_to_osd(img, config='--psm 0 -c min_characters_to_try=5')
+        return int(re.search(r"Rotate: (\d+)", osd).group(1))
     except Exception as e:
-        print(f"An error occurred during OCR: {e}")
+        print(f"OSD rotation detection failed ({e}); assuming image is upright.")
         return 0
 
 # --- FIELD DETECTION AND ORIENTATION ---
@@ -53,32 +70,51 @@ def run_bbox_model(doc_type, img_path):
     Runs field detection and orientation on an ALREADY CROPPED document image.
     Loads the model based on the document type (e.g., 'pan_model.pt', 'passport_model.pt').
     """
-    # Mapping from YOLO class names to expected field names for passport
-    YOLO_FIELD_MAPPING = {
-        "DOB": "dob",
-        "ExpiryDate": "expiry",
-        "Surname": "surname",
-        "gender": "gender",
-        "name": "name",
-        "passport number": "passport_number"
-    } if doc_type == "passport" else {}
-
-    field_model_path = f"models/{doc_type}_model.pt"
-    if not os.path.exists(field_model_path):
-        raise FileNotFoundError(f"Field detection model not found at '{field_model_path}'.")
-
-    field_model = YOLO(field_model_path)
-    processed_dir = "processed_images"
-    os.makedirs(processed_dir, exist_ok=True)
+    output = run_bbox_model_batch(doc_type, [(img_path, None)])[0]
+    if isinstance(output, Exception):
+        raise output
+    return output
 
-    img_for_processing = cv2.imread(img_path)
-    if img_for_processing is None:
-        raise ValueError(f"Failed to load pre-cropped image from path: {img_path}")
-
-    img_cv = img_for_processing
+def run_bbox_model_batch(doc_type, entries):
+    """
+    Runs field detection on a batch of already-cropped images of the SAME
+    document type. `entries` is a list of (img_path, img) pairs; img may be
+    None, in which case the image is decoded from img_path. Orientation is
+    corrected per image, but the field detection forward pass is batched so
+    the model runs once for the whole group instead of once per image.
+    Returns one entry per input: a dict mapping field names to cropped image
+    arrays, or the exception that made that image fail.
+    """
+    field_model = _get_field_model(doc_type)
+    outputs = [None] * len(entries)
+    oriented = []
+    for i, (img_path, img_cv) in enumerate(entries):
+        try:
+            if img_cv is None:
+                img_cv = cv2.imread(img_path)
+                if img_cv is None:
+                    raise ValueError(f"Failed to load pre-cropped image from path: {img_path}")
+            oriented.append((i, img_path, _orient(doc_type, img_cv)))
+        except Exception as e:
+            outputs[i] = e
+
+    if oriented:
+        results = field_model([img_cv for _, _, img_cv in oriented], verbose=False)
+        for (i, img_path, img_cv), result in zip(oriented, results):
+            try:
+                outputs[i] = _extract_field_crops(doc_type, img_path, img_cv, result)
+            except Exception as e:
+                outputs[i] = e
+
+    return outputs
+
+def _orient(doc_type, img_cv):
+    """Corrects the orientation of a pre-cropped document image."""
     h, w = img_cv.shape[:2]
 
-    # Orientation logic
+    # Aspect-ratio-based 90-degree normalization. OSD assumes approximately
+    # upright text, so get the document into the expected landscape/portrait
+    # orientation first.
     if doc_type in ["passport", "pan"]:
         if h > w:
             img_cv = cv2.rotate(img_cv, cv2.ROTATE_90_CLOCKWISE)
@@ -86,27 +122,31 @@ def run_bbox_model(doc_type, img_path):
         if w > h:
             img_cv = cv2.rotate(img_cv, cv2.ROTATE_90_CLOCKWISE)
 
-    if doc_type in ["pan", "voterid_new"]:
-        preprocessed_for_ocr = _get_preprocessed_image_data(img_cv)
-        score_0 = get_ocr_confidence(preprocessed_for_ocr)
-        img_180_preprocessed = cv2.rotate(preprocessed_for_ocr, cv2.ROTATE_180)
-        score_180 = get_ocr_confidence(img_180_preprocessed)
-    else:
-        score_0 = get_ocr_confidence(img_cv)
-        img_180 = cv2.rotate(img_cv, cv2.ROTATE_180)
-        score_180 = get_ocr_confidence(img_180)
-
-    if score_180 > score_0:
+    angle = detect_rotation(img_cv)
+    if angle == 90:
+        img_cv = cv2.rotate(img_cv, cv2.ROTATE_90_CLOCKWISE)
+    elif angle == 180:
         img_cv = cv2.rotate(img_cv, cv2.ROTATE_180)
+    elif angle == 270:
+        img_cv = cv2.rotate(img_cv, cv2.ROTATE_90_COUNTERCLOCKWISE)
 
-    cv2.imwrite(img_path, img_cv)
+    return img_cv
+
+def _extract_field_crops(doc_type, img_path, img_cv, result):
+    """Crops each detected field out of an oriented image from a YOLO result."""
+    # Mapping from YOLO class names to expected field names for passport
+    YOLO_FIELD_MAPPING = {
+        "DOB": "dob",
+        "ExpiryDate": "expiry",
+        "Surname": "surname",
+        "gender": "gender",
+        "name": "name",
+        "passport number": "passport_number"
+    } if doc_type == "passport" else {}
 
-    # --- Field Detection ---
-    results = field_model(img_cv, verbose=False)
-    result = results[0]
     names = getattr(result, 'names', None)
     base_name = os.path.splitext(os.path.basename(img_path))[0]
-    bbox_to_path = {}
+    bbox_to_array = {}
 
     # Check if the model has OBB (Oriented Bounding Boxes) or regular boxes
     boxes = getattr(result.obb, 'xyxy', None)
@@ -121,9 +161,14 @@ def run_bbox_model(doc_type, img_path):
     if boxes is None or len(boxes) == 0:
         raise ValueError(f"No bounding boxes for fields detected for {doc_type}.")
 
-    for i, (box_tensor, cls_idx) in enumerate(zip(boxes, classes)):
-        box = box_tensor.cpu().numpy().astype(int)
-        x1, y1, x2, y2 = box[:4]
+    # Move the detections to host memory in two bulk transfers instead of a
+    # tiny device sync per box inside the loop.
+    boxes_np = boxes.detach().cpu().numpy().astype(np.int32)
+    cls_np = classes.detach().cpu().numpy().astype(np.int32)
+
+    for i in range(len(boxes_np)):
+        x1, y1, x2, y2 = boxes_np[i, :4]
+        cls_idx = cls_np[i]
 
         # Apply a small expansion to PAN card fields to ensure full capture.
         if doc_type == "pan":
@@ -133,26 +178,24 @@ def run_bbox_model(doc_type, img_path):
         raw_class_name = names[int(cls_idx)] if names is not None else f"class_{int(cls_idx)}"
         mapped_class_name = YOLO_FIELD_MAPPING.get(raw_class_name, raw_class_name)
 
-        final_path = process_cropped_image(
-            cropped, base_name, mapped_class_name, output_dir=processed_dir
-        )
+        final_image = process_cropped_image(cropped, base_name, mapped_class_name)
+        if final_image is not None:
+            bbox_to_array[mapped_class_name] = final_image
 
-        bbox_to_path[mapped_class_name] = final_path
+    return bbox_to_array
 
-    return bbox_to_path
 
-
-# SAVES THE CROPPED IMAGE AND RETURNS THE PATH
+# RETURNS THE CROPPED FIELD IMAGE (OPTIONALLY SAVING IT FOR DEBUGGING)
 def process_cropped_image(cropped, base_name, class_name, output_dir="processed_images"):
-    os.makedirs(output_dir, exist_ok=True)
-    
     if cropped is None or cropped.size == 0:
-        print(f"Warning: Cannot save empty image for class '{class_name}'. Skipping.")
-        return f"path/to/empty_image_placeholder.jpg"
-        
-    final_image = cropped.copy()
-    filename = f"{base_name}_final_crop_{class_name}.jpg"
-    final_path = os.path.join(output_dir, filename)
-    cv2.imwrite(final_path, final_image)
-    
-    return final_path
\ No newline at end of file
+        print(f"Warning: Empty crop for class '{class_name}'. Skipping.")
+        return None
+
+    # The crop is a view into the full document image; downstream OCR only
+    # reads it, so there is no need to materialize a copy.
+    if _DEBUG_SAVE_CROPS:
+        os.makedirs(output_dir, exist_ok=True)
+        filename = f"{base_name}_final_crop_{class_name}.jpg"
+        cv2.imwrite(os.path.join(output_dir, filename), cropped)
+
+    return cropped
\ No newline at end of file
@@ -10,30 +10,59 @@ NUMERIC_CORRECTIONS = {
 }
 ALPHA_CORRECTIONS = {v: k for k, v in NUMERIC_CORRECTIONS.items() if k != 'I'}
 
+# Translation tables built once at import. str.translate runs in C, so the
+# positional corrections below avoid per-character Python loops; the tables
+# only contain the characters to fix, everything else passes through.
+_TO_NUMERIC = str.maketrans(NUMERIC_CORRECTIONS)
+_TO_ALPHA = str.maketrans(ALPHA_CORRECTIONS)
+
+# Regex patterns compiled once at import; these run on every OCR result.
+_CLEAN_ID_RE = re.compile(r'[^A-Z0-9$/]')
+_NON_NAME_CHARS_RE = re.compile(r'[^a-zA-Z\s]')
+_WHITESPACE_RE = re.compile(r'\s+')
+_DATE_RE = re.compile(r"^\d{2}/\d{2}/\d{4}$")
+_PASSPORT_RE = re.compile(r"^[A-Z][0-9]{7}$")
+_PAN_RE = re.compile(r"^[A-Z]{5}[0-9]{4}[A-Z]$")
+# Old (AAA/1111111 or AAA1111111) and new (AA/11/111/111111) Voter ID layouts
+# in a single alternation, so validation is one match call.
+_VOTER_ID_RE = re.compile(r"^(?:[A-Z]{3}/[0-9]{7}|[A-Z]{2}/[0-9]{2}/[0-9]{3}/[0-9]{6}|[A-Z]{3}[0-9]{7})$")
+
 # --- GENERIC CLEANING AND VALIDATION ---
 def clean_id_text(text):
     # Removes all non-alphanumeric characters except $ from a string and converts to uppercase.
-    return re.sub(r'[^A-Z0-9$/]', '', text.upper())
+    return _CLEAN_ID_RE.sub('', text.upper())
 
 def clean_name_field(text):
     # Removes all non-alphabetic characters except for spaces from a string.
     if not isinstance(text, str):
         return ""
-    cleaned_text = re.sub(r'[^a-zA-Z\s]', '', text)
-    cleaned_text = re.sub(r'\s+', ' ', cleaned_text).strip()
+    cleaned_text = _NON_NAME_CHARS_RE.sub('', text)
+    cleaned_text = _WHITESPACE_RE.sub(' ', cleaned_text).strip()
     return cleaned_text
 
 def is_valid_date_format(date_string):
     # Checks if a string strictly matches the DD/MM/YYYY format.
     if not isinstance(date_string, str):
         return False
-    return bool(re.match(r"^\d{2}/\d{2}/\d{4}$", date_string.strip()))
+    return bool(_DATE_RE.match(date_string.strip()))
 
 def is_valid_passport_format(passport_num):
     # Checks if a string matches the standard 1 Alpha, 7 Numeric passport format.
     if not isinstance(passport_num, str):
         return False
-    return bool(re.match(r"^[A-Z][0-9]{7}$", passport_num))
+    return bool(_PASSPORT_RE.match(passport_num))
+
+def is_valid_pan_format(pan_number):
+    # Checks if a string matches the 5 Alpha, 4 Numeric, 1 Alpha PAN format.
+    if not isinstance(pan_number, str):
+        return False
+    return bool(_PAN_RE.match(pan_number))
+
+def is_valid_voter_id_format(voter_id):
+    # Checks if a string matches any of the known old/new Voter ID formats.
+    if not isinstance(voter_id, str):
+        return False
+    return bool(_VOTER_ID_RE.match(voter_id))
 
 def correct_date_string(date_str):
     # Corrects specific, common OCR errors in a DD/MM/YYYY date string.
@@ -63,18 +92,12 @@ def correct_date_string(date_str):
 
 # --- DOCUMENT-SPECIFIC CORRECTIONS ---
 def apply_pan_corrections(pan_number):
-    # Corrects common OCR errors in a 10-digit PAN number based on its format.
+    # Corrects common OCR errors in a 10-digit PAN number based on its format:
+    # 5 alpha slots, 4 numeric slots, 1 alpha slot.
     if len(pan_number) == 10:
-        pan_list = list(pan_number)
-        for i in range(5):
-            if pan_list[i].isdigit() and pan_list[i] in ALPHA_CORRECTIONS:
-                pan_list[i] = ALPHA_CORRECTIONS[pan_list[i]]
-        for i in range(5, 9):
-            if pan_list[i].isalpha() and pan_list[i] in NUMERIC_CORRECTIONS:
-                pan_list[i] = NUMERIC_CORRECTIONS[pan_list[i]]
-        if pan_list[9].isdigit() and pan_list[9] in ALPHA_CORRECTIONS:
-            pan_list[9] = ALPHA_CORRECTIONS[pan_list[9]]
-        return ''.join(pan_list)
+        return (pan_number[:5].translate(_TO_ALPHA)
+                + pan_number[5:9].translate(_TO_NUMERIC)
+                + pan_number[9].translate(_TO_ALPHA))
     return pan_number
 
 def apply_passport_corrections(raw_text):
@@ -91,40 +114,21 @@ def apply_passport_corrections(raw_text):
         cleaned_text = 'S' + cleaned_text[1:]
 
     if len(cleaned_text) == 8:
-        pass_list = list(cleaned_text)
-        if pass_list[0].isdigit() and pass_list[0] in ALPHA_CORRECTIONS:
-            pass_list[0] = ALPHA_CORRECTIONS[pass_list[0]]
-        for i in range(1, 8):
-            if pass_list[i].isalpha() and pass_list[i] in NUMERIC_CORRECTIONS:
-                pass_list[i] = NUMERIC_CORRECTIONS[pass_list[i]]
-        return ''.join(pass_list)
-    
+        # 1 alpha slot followed by 7 numeric slots.
+        return cleaned_text[0].translate(_TO_ALPHA) + cleaned_text[1:].translate(_TO_NUMERIC)
+
     return cleaned_text
 
 def correct_and_reformat_voter_id(voter_id):
     # Corrects and reformats a Voter ID based on its known formats.
     temp = voter_id.replace('/', '')
-    temp_id = list(temp)
-    corrected_id = ""
 
     # Handle old 10-digit format (AAA1111111)
-    if len(temp_id) == 10:
-        for i in range(3):
-            if temp_id[i].isdigit() and temp_id[i] in ALPHA_CORRECTIONS:
-                temp_id[i] = ALPHA_CORRECTIONS[temp_id[i]]
-        for i in range(3, 10):
-            if temp_id[i].isalpha() and temp_id[i] in NUMERIC_CORRECTIONS:
-                temp_id[i] = NUMERIC_CORRECTIONS[temp_id[i]]
-        corrected_id = ''.join(temp_id)
+    if len(temp) == 10:
+        corrected_id = temp[:3].translate(_TO_ALPHA) + temp[3:].translate(_TO_NUMERIC)
     # Handle new 13-digit format (AA/11/111/111111)
-    elif len(temp_id) == 13:
-        for i in range(2):
-            if temp_id[i].isdigit() and temp_id[i] in ALPHA_CORRECTIONS:
-                temp_id[i] = ALPHA_CORRECTIONS[temp_id[i]]
-        for i in range(2, 13):
-            if temp_id[i].isalpha() and temp_id[i] in NUMERIC_CORRECTIONS:
-                temp_id[i] = NUMERIC_CORRECTIONS[temp_id[i]]
-        corrected_id = ''.join(temp_id)
+    elif len(temp) == 13:
+        corrected_id = temp[:2].translate(_TO_ALPHA) + temp[2:].translate(_TO_NUMERIC)
     else:
         # If length is wrong, return original.
         return voter_id
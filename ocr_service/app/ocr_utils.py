@@ -1,101 +1,190 @@
-"""
-This module provides utilities for performing OCR with Tesseract.
-It includes functions for image preprocessing and for running Tesseract with configurations optimized for different document types and fields.
-"""
-import cv2
-import pytesseract
-from PIL import Image
-import numpy as np
-import re
-from datetime import datetime
-import os
-
-# Tesseract OCR path (if required)
-# pytesseract.pytesseract.tesseract_cmd = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
-
-# Define processed_dir at the module level for the helper function to use
-processed_dir = "processed_images" 
-os.makedirs(processed_dir, exist_ok=True)
-
-def preprocess_image(image_path, save_path=None):
-    """Applies a general-purpose preprocessing pipeline to an image."""
-    img = cv2.imread(image_path)
-    if img is None:
-        raise ValueError(f"Failed to load image: {image_path}")
-
-    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-    denoised = cv2.bilateralFilter(gray, 11, 17, 17)
-    thresh = cv2.adaptiveThreshold(denoised, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 31, 2)
-    height, width = thresh.shape
-    resized = cv2.resize(thresh, (width * 2, height * 2), interpolation=cv2.INTER_LINEAR_EXACT)
-    kernel = np.array([[0, -1, 0], [-1, 5, -1], [0, -1, 0]])
-    sharpened = cv2.filter2D(resized, -1, kernel)
-
-    if save_path is None:
-        base_name = os.path.splitext(os.path.basename(image_path))[0]
-        save_path = os.path.join(processed_dir, f"{base_name}_preprocessed.png")
-    cv2.imwrite(save_path, sharpened)
-    return save_path
-
-def _extract_text_from_single_image(image_path, doc_type=None, field=None, skip_preprocessing=False):
-    """
-    Internal helper to preprocess, configure OCR, and extract text from a single image path.
-    Can optionally skip the preprocessing step.
-    """
-    if doc_type in ("voterid_new", "voterid_old") or skip_preprocessing:
-        processed_image_path = image_path
-        if skip_preprocessing:
-            print(f"Skipping preprocessing for field '{field}' and using raw image.")
-    else:
-        processed_image_path = preprocess_image(image_path)
-    
-    # Step 2: Select the correct Tesseract configuration
-    if doc_type == 'passport':
-        if field in ['dob', 'expiry']:  
-            custom_config = r'--psm 7 --oem 1 -c tessedit_char_whitelist=0123456789/'
-        elif field == 'passport_number':
-            custom_config = r'--psm 7 --oem 1 -c tessedit_char_whitelist=ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789$'
-        elif field in ['name', 'surname']:
-            custom_config = r'--oem 3 --psm 7 -l eng'
-        elif field == 'gender':
-            custom_config = r'--psm 7 --oem 1 -c tessedit_char_whitelist=M/F'
-        else:
-             custom_config = r'--oem 1 --psm 7 -l eng'
-    elif doc_type == 'pan':
-        if field == 'pan':
-            custom_config = r'--oem 1 --psm 13 -l eng -c tessedit_char_whitelist=ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789'
-        elif field == 'dob':
-            custom_config = r'--psm 7 --oem 1 -c tessedit_char_whitelist=0123456789/'
-        else:
-            custom_config = r'--oem 1 --psm 7 -l eng'
-    else: # Default/VoterID config
-        if field == 'voter_id':
-            custom_config = r'--oem 1 --psm 7 -l eng -c tessedit_char_whitelist=ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789/'
-        else:
-            custom_config = r'--oem 1 --psm 7 -l eng -c preserve_interword_spaces=1'
-
-    # Step 3: Run OCR
-    try:
-        text = pytesseract.image_to_string(Image.open(processed_image_path), config=custom_config)
-    except FileNotFoundError:
-        print(f"Warning: Image path not found for OCR: {processed_image_path}")
-        return "" 
-    
-    # Step 4: Apply field-specific post-processing
-    if doc_type in ("voterid_new", "voterid_old") and field == 'name':
-        text = re.sub(r'(?<=[a-z])(?=[A-Z])', ' ', text)
-    
-    return text.strip()
-
-def extract_text(image_path_or_list, doc_type=None, field=None, skip_preprocessing=False):
-    """
-    Extracts text from a single image path or a list of image paths.
-    Can optionally skip preprocessing.
-    """
-    if isinstance(image_path_or_list, list):
-        return [
-            _extract_text_from_single_image(img_path, doc_type=doc_type, field=field, skip_preprocessing=skip_preprocessing)
-            for img_path in image_path_or_list
-        ]
-    else:
-        return _extract_text_from_single_image(image_path_or_list, doc_type=doc_type, field=field, skip_preprocessing=skip_preprocessing)
\ No newline at end of file
+"""
+This module provides utilities for performing OCR with Tesseract.
+It includes functions for image preprocessing and for running Tesseract with configurations optimized for different document types and fields.
+Images are passed through as in-memory numpy arrays; intermediates are only
+written to disk when OCR_DEBUG_SAVE_CROPS=1 is set.
+"""
+import cv2
+import pytesseract
+from PIL import Image
+import numpy as np
+import re
+from datetime import datetime
+import os
+import threading
+import uuid
+
+# Prefer tesserocr's in-process C API when installed: it keeps the Tesseract
+# API object (and its ~15-30 MB LSTM model) alive between calls, instead of
+# forking a new tesseract subprocess that reloads the model on every field.
+# pytesseract remains the fallback when tesserocr is not available.
+try:
+    from tesserocr import PyTessBaseAPI, PSM, OEM
+    _TESSEROCR_AVAILABLE = True
+except ImportError:
+    _TESSEROCR_AVAILABLE = False
+
+# Tesseract OCR path (if required)
+# pytesseract.pytesseract.tesseract_cmd = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
+
+# Define processed_dir at the module level for the helper function to use
+processed_dir = "processed_images"
+os.makedirs(processed_dir, exist_ok=True)
+
+# When set, intermediate images are saved to processed_images for inspection.
+_DEBUG_SAVE_CROPS = os.getenv("OCR_DEBUG_SAVE_CROPS", "0") == "1"
+
+# Denoise mode for preprocess_array. "fast" (default) uses a SIMD-optimized
+# 3x3 Gaussian blur; "quality" rolls back to the original edge-preserving
+# bilateral filter, which is 5-10x slower, for A/B comparison.
+_PREPROC_MODE = os.getenv("PREPROC_MODE", "fast")
+
+# 5-point Laplacian sharpening kernel, built once instead of per call.
+_SHARPEN_KERNEL = np.array([[0, -1, 0], [-1, 5, -1], [0, -1, 0]])
+
+# Tesseract configuration per (doc_type, field), built once at import and
+# resolved with a single dict lookup per OCR call instead of a rebuilt string.
+_TESS_CONFIGS = {
+    ('passport', 'dob'): r'--psm 7 --oem 1 -c tessedit_char_whitelist=0123456789/',
+    ('passport', 'expiry'): r'--psm 7 --oem 1 -c tessedit_char_whitelist=0123456789/',
+    ('passport', 'passport_number'): r'--psm 7 --oem 1 -c tessedit_char_whitelist=ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789$',
+    ('passport', 'name'): r'--oem 3 --psm 7 -l eng',
+    ('passport', 'surname'): r'--oem 3 --psm 7 -l eng',
+    ('passport', 'gender'): r'--psm 7 --oem 1 -c tessedit_char_whitelist=M/F',
+    ('pan', 'pan'): r'--oem 1 --psm 13 -l eng -c tessedit_char_whitelist=ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789',
+    ('pan', 'dob'): r'--psm 7 --oem 1 -c tessedit_char_whitelist=0123456789/',
+    ('voterid_new', 'voter_id'): r'--oem 1 --psm 7 -l eng -c tessedit_char_whitelist=ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789/',
+    ('voterid_old', 'voter_id'): r'--oem 1 --psm 7 -l eng -c tessedit_char_whitelist=ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789/',
+}
+# Per-doc-type fallbacks for fields without a specialized entry.
+_DEFAULT_CONFIGS = {
+    'passport': r'--oem 1 --psm 7 -l eng',
+    'pan': r'--oem 1 --psm 7 -l eng',
+}
+_FALLBACK_CONFIG = r'--oem 1 --psm 7 -l eng -c preserve_interword_spaces=1'
+_VOTER_ID_CONFIG = r'--oem 1 --psm 7 -l eng -c tessedit_char_whitelist=ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789/'
+
+def _get_tess_config(doc_type, field):
+    """Resolves the Tesseract config for a (doc_type, field) combination."""
+    custom_config = _TESS_CONFIGS.get((doc_type, field))
+    if custom_config is None:
+        if doc_type in _DEFAULT_CONFIGS:
+            custom_config = _DEFAULT_CONFIGS[doc_type]
+        elif field == 'voter_id':
+            custom_config = _VOTER_ID_CONFIG
+        else:
+            custom_config = _FALLBACK_CONFIG
+    return custom_config
+
+# PyTessBaseAPI instances are not thread-safe, so each OCR thread keeps its
+# own pool of APIs, one per distinct Tesseract configuration.
+_thread_apis = threading.local()
+
+def _parse_tess_config(config):
+    """Parses a pytesseract-style config string into tesserocr API arguments."""
+    psm, oem, lang = 3, 3, "eng"
+    variables = {}
+    tokens = config.split()
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        if token == "--psm":
+            psm = int(tokens[i + 1]); i += 2
+        elif token == "--oem":
+            oem = int(tokens[i + 1]); i += 2
+        elif token == "-l":
+            lang = tokens[i + 1]; i += 2
+        elif token == "-c":
+            name, _, value = tokens[i + 1].partition("=")
+            variables[name] = value
+            i += 2
+        else:
+            i += 1
+    return psm, oem, lang, variables
+
+def _get_api(config):
+    """Returns this thread's cached PyTessBaseAPI for a config string."""
+    apis = getattr(_thread_apis, "apis", None)
+    if apis is None:
+        apis = _thread_apis.apis = {}
+    api = apis.get(config)
+    if api is None:
+        psm, oem, lang, variables = _parse_tess_config(config)
+        api = PyTessBaseAPI(psm=PSM(psm), oem=OEM(oem), lang=lang)
+        for name, value in variables.items():
+            api.SetVariable(name, value)
+        apis[config] = api
+    return api
+
+def preprocess_array(img_bgr):
+    """
+    Applies the general-purpose preprocessing pipeline to an in-memory BGR
+    image and returns the result as a grayscale array.
+
+    The pipeline is memory-bandwidth-bound, so it is written to minimize
+    full-frame traffic: the slow edge-preserving bilateral filter is replaced
+    by a 3x3 Gaussian blur (the adaptive threshold that follows does the heavy
+    lifting of noise removal), and the denoise/threshold steps run in place on
+    the grayscale buffer instead of allocating a fresh intermediate per step.
+    """
+    gray = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2GRAY)
+    if _PREPROC_MODE == "quality":
+        gray = cv2.bilateralFilter(gray, 11, 17, 17)
+    else:
+        cv2.GaussianBlur(gray, (3, 3), 0, dst=gray)
+    cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 31, 2, dst=gray)
+    height, width = gray.shape
+    resized = cv2.resize(gray, (width * 2, height * 2), interpolation=cv2.INTER_LINEAR_EXACT)
+    sharpened = cv2.filter2D(resized, -1, _SHARPEN_KERNEL)
+    return sharpened
+
+def _extract_text_from_single_image(img, doc_type=None, field=None, skip_preprocessing=False):
+    """
+    Internal helper to preprocess, configure OCR, and extract text from a
+    single in-memory BGR image. Can optionally skip the preprocessing step.
+    """
+    if img is None or img.size == 0:
+        print(f"Warning: Empty image given for OCR (field '{field}').")
+        return ""
+
+    if doc_type in ("voterid_new", "voterid_old") or skip_preprocessing:
+        # Raw path: Tesseract expects RGB channel order, OpenCV stores BGR.
+        pil_img = Image.fromarray(cv2.cvtColor(img, cv2.COLOR_BGR2RGB))
+        if skip_preprocessing:
+            print(f"Skipping preprocessing for field '{field}' and using raw image.")
+    else:
+        processed = preprocess_array(img)
+        if _DEBUG_SAVE_CROPS:
+            debug_path = os.path.join(processed_dir, f"debug_{field}_{uuid.uuid4().hex[:8]}_preprocessed.png")
+            cv2.imwrite(debug_path, processed)
+        pil_img = Image.fromarray(processed)
+
+    # Step 2: Select the correct Tesseract configuration
+    custom_config = _get_tess_config(doc_type, field)
+
+    # Step 3: Run OCR
+    if _TESSEROCR_AVAILABLE:
+        api = _get_api(custom_config)
+        api.SetImage(pil_img)
+        text = api.GetUTF8Text()
+    else:
+        text = pytesseract.image_to_string(pil_img, config=custom_config)
+
+    # Step 4: Apply field-specific post-processing
+    if doc_type in ("voterid_new", "voterid_old") and field == 'name':
+        text = re.sub(r'(?<=[a-z])(?=[A-Z])', ' ', text)
+
+    return text.strip()
+
+def extract_text(image_or_list, doc_type=None, field=None, skip_preprocessing=False):
+    """
+    Extracts text from a single BGR image array or a list of image arrays.
+    Can optionally skip preprocessing.
+    """
+    if isinstance(image_or_list, list):
+        return [
+            _extract_text_from_single_image(img, doc_type=doc_type, field=field, skip_preprocessing=skip_preprocessing)
+            for img in image_or_list
+        ]
+    else:
+        return _extract_text_from_single_image(image_or_list, doc_type=doc_type, field=field, skip_preprocessing=skip_preprocessing)
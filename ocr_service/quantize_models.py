@@ -0,0 +1,89 @@
+"""
+Offline post-training INT8 quantization for the models used by this service.
+
+Run once from the ocr_service directory after training or updating models:
+
+    python quantize_models.py --calibration-dir uploads --yolo-data calib.yaml
+
+Produces:
+  - models/classifier_model_int8.tflite        (INT8 TFLite classifier)
+  - models/<name>_openvino_int8_model/         (INT8 OpenVINO export per YOLO model)
+
+The runtime modules pick these artifacts up automatically when present and
+fall back to the FP32 originals otherwise. INT8 quantization can cost a small
+amount of accuracy, so validate classification accuracy and per-field mAP on a
+holdout set before deploying the quantized models.
+"""
+import argparse
+import glob
+import os
+
+YOLO_MODEL_PATHS = [
+    "models/cropping_model.pt",
+    "models/pan_model.pt",
+    "models/passport_model.pt",
+    "models/voterid_new_model.pt",
+    "models/voterid_old_model.pt",
+]
+
+def quantize_classifier(calibration_dir):
+    """Converts the Keras classifier to a fully-integer INT8 TFLite model."""
+    import numpy as np
+    import tensorflow as tf
+    from tensorflow.keras.models import load_model
+    from tensorflow.keras.preprocessing import image
+
+    calibration_paths = sorted(
+        glob.glob(os.path.join(calibration_dir, "*.jpg"))
+        + glob.glob(os.path.join(calibration_dir, "*.jpeg"))
+        + glob.glob(os.path.join(calibration_dir, "*.png"))
+    )[:100]
+    if not calibration_paths:
+        raise FileNotFoundError(f"No calibration images found in '{calibration_dir}'.")
+
+    def representative_dataset():
+        # Yield ~100 crops preprocessed exactly like classify_document does.
+        for img_path in calibration_paths:
+            img = image.load_img(img_path, target_size=(224, 224))
+            x = image.img_to_array(img)
+            x = np.expand_dims(x, axis=0)
+            x = (x / 255.0).astype(np.float32)
+            yield [x]
+
+    converter = tf.lite.TFLiteConverter.from_keras_model(load_model("models/classifier_model.h5"))
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    converter.representative_dataset = representative_dataset
+    converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    converter.inference_input_type = tf.int8
+    converter.inference_output_type = tf.int8
+
+    tflite_model = converter.convert()
+    out_path = "models/classifier_model_int8.tflite"
+    with open(out_path, "wb") as f:
+        f.write(tflite_model)
+    print(f"Wrote {out_path} ({len(tflite_model) / 1e6:.1f} MB)")
+
+def quantize_yolo_models(data_yaml):
+    """Exports each available YOLO model to an INT8 OpenVINO directory."""
+    from ultralytics import YOLO
+
+    for model_path in YOLO_MODEL_PATHS:
+        if not os.path.exists(model_path):
+            print(f"Skipping '{model_path}' (not found).")
+            continue
+        print(f"Exporting '{model_path}' to INT8 OpenVINO...")
+        YOLO(model_path).export(format="openvino", int8=True, data=data_yaml)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Post-training INT8 quantization for service models.")
+    parser.add_argument("--calibration-dir", default="uploads",
+                        help="Directory of representative document images for classifier calibration.")
+    parser.add_argument("--yolo-data", default=None,
+                        help="Ultralytics dataset yaml used for YOLO INT8 calibration. YOLO export is skipped if omitted.")
+    args = parser.parse_args()
+
+    quantize_classifier(args.calibration_dir)
+    if args.yolo_data:
+        quantize_yolo_models(args.yolo_data)
+    else:
+        print("No --yolo-data given; skipping YOLO INT8 export.")